@@ -1,22 +1,98 @@
+import argparse
+import functools
+import hashlib
+import json
+import logging
 import os
 import sys
 import subprocess
 import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
 from pathlib import Path
 
-def check_pyinstaller():
-    """检查是否安装了PyInstaller"""
+# 构建目标: (当前目录下的脚本文件, 可执行文件名, 图标文件)
+TARGETS = [
+    ("random_file_opener.py", "RandomFileOpener", "icon.ico"),
+]
+
+# 内存文件系统（Linux），存在时 PyInstaller 的中间文件写入其中
+RAM_DIR = Path("/dev/shm")
+# 内存文件系统剩余空间低于此值时改用磁盘，避免构建中途写满 /dev/shm
+RAM_MIN_FREE = 1 << 30
+
+# 可执行文件后缀，仅 Windows 下带 .exe
+EXE_SUFFIX = ".exe" if os.name == "nt" else ""
+
+# 已经压缩过的文件类型，打包时直接存储，不再重复 deflate
+STORED_SUFFIXES = {".zip", ".pyz", ".gz", ".bz2", ".xz", ".7z", ".png", ".jpg", ".jpeg", ".ico"}
+
+# 签名时使用的 RFC 3161 时间戳服务器，证书过期后签名依然有效
+TIMESTAMP_URL = "http://timestamp.digicert.com"
+
+# 外部工具路径缓存文件
+TOOL_CACHE_FILE = Path.home() / ".cache" / "build_exe" / "tool_paths.json"
+
+# 压缩收益很小或压缩后无法加载的文件，跳过 UPX 以缩短压缩阶段
+UPX_EXCLUDE = [
+    "vcruntime140.dll",
+    "vcruntime140_1.dll",
+    "python3.dll",
+    f"python{sys.version_info[0]}{sys.version_info[1]}.dll",
+]
+
+# PE 头中的控制流保护(CFG)标志，带此标志的文件经 UPX 压缩后无法加载
+IMAGE_DLLCHARACTERISTICS_GUARD_CF = 0x4000
+
+logger = logging.getLogger("build_exe")
+
+@functools.lru_cache(maxsize=None)
+def _pyinstaller_version():
+    """读取已安装 PyInstaller 的主次版本号，不导入 PyInstaller；无法判断时返回 None"""
     try:
-        import PyInstaller
-        return True
-    except ImportError:
-        print("错误: 未安装 PyInstaller。")
-        print("请运行: pip install pyinstaller")
+        from importlib.metadata import version
+        return tuple(int(p) for p in version("pyinstaller").split(".")[:2])
+    except Exception:
+        return None
+
+def _supports_optimize_flag():
+    """PyInstaller 6.6 起支持 --optimize 参数"""
+    ver = _pyinstaller_version()
+    return ver is None or ver >= (6, 6)
+
+def _supports_contents_directory():
+    """PyInstaller 6.0 起支持 --contents-directory 参数，5.x 会直接报错"""
+    ver = _pyinstaller_version()
+    return ver is None or ver >= (6, 0)
+
+def _ram_dir_available():
+    """内存文件系统存在且剩余空间充足时返回 True"""
+    try:
+        return shutil.disk_usage(RAM_DIR).free >= RAM_MIN_FREE
+    except OSError:
         return False
 
-def generate_version_info(file_path):
-    """生成Windows版本信息文件"""
-    content = """
+def _setup_logging(verbose=False):
+    """配置构建脚本的日志输出，不影响 PyInstaller 自身的日志配置；verbose 时输出调试信息"""
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.propagate = False
+
+def check_pyinstaller():
+    """检查是否安装了PyInstaller（只查找模块，不执行其初始化代码）"""
+    if find_spec("PyInstaller") is not None:
+        return True
+    logger.error("错误: 未安装 PyInstaller。")
+    logger.info("请运行: pip install pyinstaller")
+    return False
+
+VERSION_INFO = """
 # UTF-8
 VSVersionInfo(
   ffi=FixedFileInfo(
@@ -46,85 +122,361 @@ VSVersionInfo(
     VarFileInfo([VarStruct(u'Translation', [2052, 1200])])
   ]
 )
-"""
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+""".encode('utf-8')
 
-def build_exe():
-    """构建可执行文件"""
-    if not check_pyinstaller():
+def generate_version_info(file_path):
+    """生成Windows版本信息文件，内容未变化时不重写，保留修改时间以免 PyInstaller 缓存失效"""
+    file_path = Path(file_path)
+    try:
+        # 先比较大小，只有大小一致时才读取内容比较
+        if file_path.stat().st_size == len(VERSION_INFO) and file_path.read_bytes() == VERSION_INFO:
+            return
+    except FileNotFoundError:
+        pass
+    file_path.write_bytes(VERSION_INFO)
+
+def _fingerprint(script_path, icon_path, flags):
+    """计算脚本、版本信息、图标、构建参数与 PyInstaller 版本的指纹，用于判断是否需要重新构建"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(script_path.read_bytes())
+    digest.update(VERSION_INFO)
+    if icon_path:
+        digest.update(icon_path.read_bytes())
+    digest.update("\0".join(flags).encode("utf-8"))
+    digest.update(repr(_pyinstaller_version()).encode("ascii"))
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def _find_tool(tool):
+    """查找外部工具，按 PATH 的哈希把找到的路径缓存到用户目录，避免每次遍历 PATH"""
+    path_hash = hashlib.blake2b(os.environ.get("PATH", "").encode("utf-8"), digest_size=16).hexdigest()
+    try:
+        cache = json.loads(TOOL_CACHE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        cache = {}
+    if cache.get("path_hash") != path_hash:
+        cache = {"path_hash": path_hash, "tools": {}}
+
+    cached = cache["tools"].get(tool)
+    if cached and os.path.isfile(cached):
+        return cached
+
+    # 只缓存找到的结果，未找到时下次仍会重新查找
+    found = shutil.which(tool)
+    if found:
+        cache["tools"][tool] = found
+        try:
+            TOOL_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            TOOL_CACHE_FILE.write_text(json.dumps(cache), encoding="utf-8")
+        except OSError:
+            pass
+    return found
+
+def _discard_dir(path):
+    """将目录改名移走后在后台线程删除，改名只是一次元数据操作，不阻塞后续构建"""
+    graveyard = path.with_name(f"{path.name}.old.{os.getpid()}")
+    try:
+        os.replace(path, graveyard)
+    except OSError as e:
+        logger.warning(f"警告: 无法清理构建目录: {e}")
         return
+    # 顺带清理以前异常退出时遗留的目录；非守护线程，退出前会等待删除完成
+    stale = [graveyard] + [p for p in path.parent.glob(f"{path.name}.old.*") if p != graveyard]
+    threading.Thread(
+        target=lambda: [shutil.rmtree(p, ignore_errors=True) for p in stale]
+    ).start()
 
-    # 设置路径
-    work_dir = Path("build_output")
-    dist_dir = work_dir / "dist"
-    build_temp_dir = work_dir / "build"
-    script_path = Path("random_file_opener.py").resolve()
-    
-    if not script_path.exists():
-        print(f"错误: 找不到脚本文件 {script_path}")
+def _is_qt_plugin(path, bundle_dir):
+    """与 PyInstaller 一致，Qt 插件压缩后无法被 Qt 识别，不做 UPX 处理"""
+    parts = [p.lower() for p in path.relative_to(bundle_dir).parts[:-1]]
+    return "plugins" in parts and any(p.startswith(("qt", "pyqt", "pyside")) for p in parts)
+
+def _is_cfg_enabled(path):
+    """检查 PE 文件是否启用了控制流保护（PyInstaller 同样跳过此类文件）；无法判断时视为启用"""
+    try:
+        import pefile
+        pe = pefile.PE(str(path), fast_load=True)
+    except Exception:
+        return True
+    try:
+        return bool(pe.OPTIONAL_HEADER.DllCharacteristics & IMAGE_DLLCHARACTERISTICS_GUARD_CF)
+    finally:
+        pe.close()
+
+def _upx_compress_file(upx_path, path):
+    """压缩单个文件，跳过启用 CFG 的文件，返回是否压缩成功"""
+    if _is_cfg_enabled(path):
+        return False
+    # 已压缩或不支持的文件会返回非零状态，视为未压缩
+    result = subprocess.run([upx_path, "--best", "-q", str(path)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+def _upx_compress(upx_path, bundle_dir):
+    """并行调用 UPX 压缩目录中的 DLL/PYD，UPX 单进程只用一个核心；返回实际压缩成功的文件集合"""
+    files = [
+        f for pattern in ("*.dll", "*.pyd")
+        for f in bundle_dir.rglob(pattern)
+        if f.name.lower() not in UPX_EXCLUDE and not _is_qt_plugin(f, bundle_dir)
+    ]
+    if not files:
+        return set()
+    logger.info(f"使用 UPX 并行压缩 {len(files)} 个文件...")
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        results = executor.map(functools.partial(_upx_compress_file, upx_path), files)
+        return {f for f, packed in zip(files, results) if packed}
+
+def _sign_files(signtool_path, bundle_dir):
+    """使用 signtool 为目录中的可执行文件签名并加盖时间戳"""
+    files = [str(f) for f in bundle_dir.glob("*.exe")]
+    if not files:
         return
-    
-    # 清理旧构建
-    if work_dir.exists():
-        try:
-            shutil.rmtree(work_dir)
-        except Exception as e:
-            print(f"警告: 无法清理构建目录: {e}")
+    logger.info(f"使用 signtool 签名 {len(files)} 个文件...")
+    result = subprocess.run([signtool_path, "sign", "/a", "/fd", "SHA256",
+                             "/tr", TIMESTAMP_URL, "/td", "SHA256", "/q", *files],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if result.returncode != 0:
+        logger.warning(f"警告: 签名失败 (代码 {result.returncode})")
+
+def _make_archive(bundle_dir, archive_path, stored_paths=frozenset()):
+    """打包分发压缩包，已压缩的文件（按扩展名或 UPX 压缩结果）直接存储以省去无效的 deflate"""
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path in sorted(bundle_dir.rglob("*")):
+            arcname = path.relative_to(bundle_dir.parent)
+            if path.is_dir():
+                archive.write(path, arcname)
+            elif path.suffix.lower() in STORED_SUFFIXES or path in stored_paths:
+                archive.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+            else:
+                archive.write(path, arcname)
+    return archive_path
+
+def _post_process(name, upx_path, signtool_path, bundle_dir, dist_dir):
+    """构建后处理: UPX 压缩、签名、打包压缩包（签名必须在压缩之后）"""
+    # 只有 UPX 实际压缩成功的 DLL/PYD 才无需再压缩
+    upx_packed = _upx_compress(upx_path, bundle_dir) if upx_path else set()
+    if signtool_path:
+        _sign_files(signtool_path, bundle_dir)
+    archive = _make_archive(bundle_dir, dist_dir / f"{name}.zip", upx_packed)
+    logger.info(f"[{name}] 已生成分发压缩包: {archive}")
+
+def _run_pyinstaller_subprocess(name, cmd, env, post):
+    """以子进程运行 PyInstaller 并流式读取输出，COLLECT 完成后立即在后台执行后处理，
+    与 PyInstaller 的收尾工作重叠进行"""
+    with ThreadPoolExecutor(max_workers=1) as post_executor:
+        post_future = None
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                bufsize=1, text=True, errors='replace')
+        with proc:
+            for line in proc.stdout:
+                logger.info(f"[{name}] {line.rstrip()}")
+                if post_future is None and "COLLECT" in line and "completed successfully" in line:
+                    post_future = post_executor.submit(post)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        if post_future is None:
+            post_future = post_executor.submit(post)
+        post_future.result()
+
+def _run_pyinstaller_in_process(pyi_args, env, post):
+    """在当前进程中运行 PyInstaller，省去启动新解释器并重新导入 PyInstaller 的开销"""
+    # PyInstaller 在导入时读取配置目录，必须先设置环境变量
+    os.environ["PYINSTALLER_CONFIG_DIR"] = env["PYINSTALLER_CONFIG_DIR"]
+    from PyInstaller.__main__ import run as pyi_run
+    try:
+        pyi_run(pyi_args)
+    except SystemExit as e:
+        if e.code:
+            raise subprocess.CalledProcessError(e.code, ["PyInstaller", *pyi_args])
+    post()
+
+def _build_target(index, script_path, name, icon_path, upx_path, signtool_path, version_file, work_dir,
+                  in_process=False, exec_mode=False):
+    """构建单个目标，返回是否成功"""
+    # 每个任务使用独立的工作目录与 PyInstaller 配置目录，避免并发构建互相破坏缓存
+    job_dir = work_dir / f"job_{index}"
+    dist_dir = work_dir / "dist"
+    # 中间文件放在内存文件系统中（进程内唯一，构建后删除）；exec 模式无法事后清理，仍写入磁盘
+    disk_temp_dir = job_dir / "build"
+    in_ram = not exec_mode and _ram_dir_available()
+    build_temp_dir = RAM_DIR / f"pyi-work-{os.getpid()}-{index}" if in_ram else disk_temp_dir
+    fingerprint_file = job_dir / ".fingerprint"
+    bundle_dir = dist_dir / name
+    exe_path = bundle_dir / (name + EXE_SUFFIX)
 
-    # 准备版本信息
-    version_file = work_dir / "file_version_info.txt"
-    work_dir.mkdir(parents=True, exist_ok=True)
-    generate_version_info(version_file)
-    
-    # 查找图标
-    icon_path = Path("icon.ico")
-    
     # PyInstaller 命令参数
-    cmd = [
+    cmd = (
         sys.executable, "-m", "PyInstaller",
         "--noconfirm",
-        "--onefile",  # 单文件模式
+        "--onedir",  # 目录模式，省去单文件归档的打包与运行时解压
         "--console",  # 显示控制台
-        "--name", "RandomFileOpener",
-        "--clean",
+        "--name", name,
         "--distpath", str(dist_dir),
         "--workpath", str(build_temp_dir),
-        "--specpath", str(work_dir),
-        f"--version-file={version_file.resolve()}",
-    ]
-    
+        "--specpath", str(job_dir),
+        f"--version-file={version_file.absolute()}",
+        "--noupx",  # 由构建后的并行 UPX 步骤负责压缩
+    ) + (("--contents-directory=_internal",) if _supports_contents_directory() else ()) + (
+        (f"--icon={icon_path.absolute()}",) if icon_path else ()
+    ) + (
+        ("--optimize=2",) if _supports_optimize_flag() else ()  # 去除断言与文档字符串，缩小字节码
+    ) + (str(script_path),)
+
+    # 源码、图标、构建参数、是否签名与 PyInstaller 版本均未变化时跳过构建；--workpath 随进程变化，不计入指纹
+    workpath_index = cmd.index("--workpath")
+    flags = cmd[:workpath_index] + cmd[workpath_index + 2:] + (("--sign",) if signtool_path else ())
+    fingerprint = _fingerprint(script_path, icon_path, flags)
+    if (exe_path.exists() and fingerprint_file.exists()
+            and fingerprint_file.read_text(encoding='utf-8') == fingerprint):
+        logger.info(f"[{name}] 构建输入未变化，跳过构建: {exe_path}")
+        return True
+
+    # 清理旧的中间文件（保留 dist 与版本信息文件）
+    if disk_temp_dir.exists():
+        _discard_dir(disk_temp_dir)
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    # 每个任务固定使用自己的配置目录，PyInstaller 的二进制处理缓存可在多次构建间复用
+    env = dict(os.environ)
+    env["PYINSTALLER_CONFIG_DIR"] = str((work_dir / "cache" / f"job_{index}").absolute())
+    if not _supports_optimize_flag():
+        # 旧版 PyInstaller 按构建进程的优化级别收集字节码
+        env["PYTHONOPTIMIZE"] = "2"
+
+    logger.info(f"[{name}] 开始构建...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[%s] 命令: %s", name, " ".join(cmd))
+
+    if exec_mode:
+        # 用 PyInstaller 进程替换当前进程，不再返回；构建后处理与指纹记录都会被跳过
+        sys.stdout.flush()
+        os.execve(sys.executable, cmd, env)
+
+    def post():
+        _post_process(name, upx_path, signtool_path, bundle_dir, dist_dir)
+
+    try:
+        if in_process:
+            # 去掉 "python -m PyInstaller" 前缀
+            _run_pyinstaller_in_process(list(cmd[3:]), env, post)
+        else:
+            _run_pyinstaller_subprocess(name, cmd, env, post)
+        fingerprint_file.write_text(fingerprint, encoding='utf-8')
+        logger.info(f"[{name}] 构建成功: {exe_path}")
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"\n[{name}] 构建失败: {e}")
+    except Exception as e:
+        logger.error(f"\n[{name}] 发生错误: {e}")
+    finally:
+        if in_ram:
+            shutil.rmtree(build_temp_dir, ignore_errors=True)
+    return False
+
+def build_exe(targets=None, exec_mode=False, sign=False, verbose=False):
+    """构建可执行文件，多个目标时并行执行"""
+    _setup_logging(verbose)
+    if not check_pyinstaller():
+        return
+
+    targets = targets or TARGETS
+    work_dir = Path("build_output")
+
+    # 一次 scandir 缓存当前目录的条目，代替逐个 exists()/is_dir() 调用
+    with os.scandir(".") as it:
+        entries = {entry.name: entry for entry in it}
+
+    # 检查脚本与图标
+    jobs = []
+    for script, name, icon in targets:
+        script_path = Path(script).absolute()
+        if script not in entries:
+            logger.error(f"错误: 找不到脚本文件 {script_path}")
+            return
+        icon_path = None
+        if icon and icon in entries:
+            icon_path = Path(icon)
+            logger.info(f"发现图标文件: {icon_path}")
+        jobs.append((script_path, name, icon_path))
+
+    # 准备版本信息
+    version_file = work_dir / "file_version_info.txt"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    generate_version_info(version_file)
+
     # 查找UPX
-    upx_path = shutil.which("upx")
+    upx_path = _find_tool("upx")
     if upx_path:
-        print(f"发现 UPX 压缩工具: {upx_path}")
-        cmd.append("--upx-dir={}".format(str(Path(upx_path).parent)))
+        logger.info(f"发现 UPX 压缩工具: {upx_path}")
     else:
-        print("未发现 UPX，生成的 EXE 体积可能会稍大。")
+        logger.info("未发现 UPX，生成的 EXE 体积可能会稍大。")
         # 尝试查找当前目录下的 upx
         local_upx = Path("upx")
-        if local_upx.exists() and local_upx.is_dir():
-             print(f"发现本地 UPX 目录: {local_upx}")
-             cmd.append(f"--upx-dir={local_upx}")
-
-    if icon_path.exists():
-        print(f"发现图标文件: {icon_path}")
-        cmd.append(f"--icon={icon_path}")
-    
-    cmd.append(str(script_path))
-    
-    print("开始构建...")
-    print(f"命令: {' '.join(cmd)}")
-    
-    try:
-        subprocess.check_call(cmd)
-        print("\n" + "="*50)
-        print(f"构建成功! 可执行文件位于:\n{dist_dir / 'RandomFileOpener.exe'}")
-        print("="*50)
-    except subprocess.CalledProcessError as e:
-        print(f"\n构建失败: {e}")
-    except Exception as e:
-        print(f"\n发生错误: {e}")
+        if "upx" in entries and entries["upx"].is_dir():
+             logger.info(f"发现本地 UPX 目录: {local_upx}")
+             upx_path = shutil.which("upx", path=str(local_upx.absolute()))
+
+    # 签名需显式开启，避免在装有 signtool 的机器上自动选用证书
+    signtool_path = None
+    if sign:
+        signtool_path = _find_tool("signtool")
+        if signtool_path:
+            logger.info(f"发现签名工具: {signtool_path}")
+        else:
+            logger.warning("警告: 未找到 signtool，跳过签名")
+
+    if exec_mode and len(jobs) > 1:
+        logger.warning("警告: --exec 仅支持单个构建目标，已忽略")
+        exec_mode = False
+    if exec_mode and os.name == "nt":
+        # Windows 下 execve 只是启动新进程后退出当前进程，控制台会提前返回，改为普通构建
+        logger.warning("警告: Windows 不支持 --exec，已忽略")
+        exec_mode = False
+
+    if len(jobs) == 1:
+        # 单个目标直接在当前进程中运行 PyInstaller；旧版需要通过 PYTHONOPTIMIZE 启动子进程
+        script_path, name, icon_path = jobs[0]
+        results = [_build_target(0, script_path, name, icon_path, upx_path, signtool_path, version_file, work_dir,
+                                 in_process=_supports_optimize_flag(), exec_mode=exec_mode)]
+    else:
+        # PyInstaller 自身是单线程的，且全局状态无法在同一进程内并发，多个目标按核心数并发启动子进程
+        workers = min(len(jobs), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_build_target, i, script_path, name, icon_path, upx_path, signtool_path,
+                                version_file, work_dir)
+                for i, (script_path, name, icon_path) in enumerate(jobs)
+            ]
+            results = [future.result() for future in futures]
+
+    logger.info("\n" + "="*50)
+    if all(results):
+        logger.info(f"构建成功! 可执行文件位于:\n{work_dir / 'dist'}")
+    else:
+        logger.error(f"构建失败: {results.count(False)}/{len(results)} 个目标未能完成")
+    logger.info("="*50)
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="使用 PyInstaller 构建随机文件打开器")
+    parser.add_argument(
+        "--exec",
+        dest="exec_mode",
+        action="store_true",
+        help="完成准备工作后直接用 PyInstaller 替换当前进程（跳过 UPX、签名与压缩包等后处理）"
+    )
+    parser.add_argument(
+        "--sign",
+        action="store_true",
+        help=f"使用 signtool 自动选择的证书为生成的 EXE 签名，并通过 {TIMESTAMP_URL} 加盖时间戳"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="输出调试信息，包括完整的 PyInstaller 命令行"
+    )
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    build_exe()
+    args = parse_args()
+    build_exe(exec_mode=args.exec_mode, sign=args.sign, verbose=args.verbose)
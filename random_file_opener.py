@@ -5,10 +5,11 @@ import hashlib
 import json
 import logging
 import logging.handlers
-import mimetypes
 import os
 import platform
+import queue
 import random
+import re
 import shutil
 import subprocess
 import sys
@@ -20,8 +21,9 @@ from collections import OrderedDict, deque
 from dataclasses import asdict, dataclass, field
 from datetime import datetime
 from pathlib import Path
+from stat import S_ISDIR, S_ISREG
 from threading import Lock, RLock
-from typing import Any, Deque, Dict, Generic, List, Optional, Tuple, TypeVar, Union
+from typing import Any, Callable, Deque, Dict, Generic, List, Optional, Tuple, TypeVar, Union
 
 # 检查Python版本
 if sys.version_info < (3, 7):
@@ -33,6 +35,39 @@ T = TypeVar('T')
 K = TypeVar('K')
 V = TypeVar('V')
 
+# hashlib.file_digest (Python 3.11+) 在C层循环读取并计算哈希
+HAS_FILE_DIGEST = sys.version_info >= (3, 11)
+
+# 批量打开时两次打开之间的最小间隔（秒），打开本身已耗时更久时不再额外等待
+BATCH_MIN_INTERVAL = 0.2
+
+# Linux下依次尝试的文件打开程序
+LINUX_OPENERS = ("xdg-open", "gnome-open", "kde-open")
+
+# 日志级别名称到数值的映射，避免每次记录日志时 getattr + upper
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+# 可选的高性能JSON库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 可选的高性能哈希库，哈希仅用于检测文件变化，不需要SHA-256的密码学强度
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# blake3 对超过此大小的文件启用多线程哈希
+BLAKE3_THREADING_THRESHOLD = 1 << 20
+
 # 检查必要模块
 try:
     from dataclasses import dataclass, field, asdict
@@ -41,6 +76,28 @@ except ImportError as e:
     sys.exit(1)
 
 
+def _stop_queue_listener(listener: logging.handlers.QueueListener) -> None:
+    """停止日志监听线程，写完队列中剩余的记录并关闭其handlers；未启动或已停止时直接返回"""
+    if not getattr(listener, 'running', False):
+        return
+    listener.running = False
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def _stop_active_log_listeners() -> None:
+    """进程退出时停止当前挂在 RandomFileOpener logger 上的日志监听线程"""
+    for handler in logging.getLogger("RandomFileOpener").handlers:
+        listener = getattr(handler, 'listener', None)
+        if listener is not None:
+            _stop_queue_listener(listener)
+
+
+# 只注册一次，不持有任何实例的引用；旧实例的监听线程在重新配置日志时即被停止
+atexit.register(_stop_active_log_listeners)
+
+
 @dataclass
 class Config:
     """配置类，集中管理所有配置参数"""
@@ -49,6 +106,7 @@ class Config:
     log_filename: str = ".file_opener_log.txt"
     config_filename: str = ".file_opener_config.json"
     extended_log_filename: str = ".file_opener_extended_log.json"
+    atomic_history_write: bool = True  # 通过临时文件+重命名写入历史记录，关闭后直接覆盖写入
     
     # 性能配置
     max_retries: int = 2
@@ -57,7 +115,8 @@ class Config:
     max_backup_files: int = 10  # 最大备份文件数
     max_file_size_for_full_hash: int = 10 * 1024 * 1024  # 10MB，大于此大小的文件计算部分哈希
     hash_cache_size: int = 100  # 哈希缓存最大条目数
-    pattern_cache_size: int = 500  # 模式匹配缓存最大条目数
+    hash_block_size: int = 1024 * 1024  # 计算哈希时每次读取的块大小（1MB）
+    hash_mode: str = "fingerprint"  # 哈希模式: fingerprint(大小+修改时间+inode), sampling(抽样), full(完整SHA-256)
     encoding_cache_size: int = 50  # 编码检测缓存大小
     file_type_cache_size: int = 200  # 文件类型检测缓存大小
     batch_scan_size: int = 100  # 批量扫描文件数
@@ -132,6 +191,20 @@ class Config:
         
         self.text_extensions = [ext.lower() for ext in (self.text_extensions or [])]
         self.system_executable_extensions = [ext.lower() for ext in (self.system_executable_extensions or [])]
+        
+        # 用于O(1)成员判断的扩展名集合（不属于dataclass字段，不会写入配置文件）
+        self._text_ext_set = frozenset(self.text_extensions)
+        self._exec_ext_key = tuple(self.system_executable_extensions)
+        self._exec_ext_frozen = frozenset(self._exec_ext_key)
+    
+    @property
+    def _exec_ext_set(self) -> frozenset:
+        """系统可执行文件扩展名集合，system_executable_extensions 被修改（包括原地修改）后重新构建"""
+        key = tuple(self.system_executable_extensions)
+        if key != self._exec_ext_key:
+            self._exec_ext_frozen = frozenset(ext.lower() for ext in key)
+            self._exec_ext_key = key
+        return self._exec_ext_frozen
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Config':
@@ -147,32 +220,32 @@ class Config:
 
 
 class AtomicCounter:
-    """高性能原子计数器"""
+    """高性能计数器
+    
+    增减与读取不加锁：在CPython的GIL下，对整数属性的 += 不会破坏对象状态，
+    极端并发下最多少计几次，对于统计用途可以接受。只有 reset 这种读后写的复合操作加锁。
+    """
     def __init__(self, initial_value: int = 0):
         self._value = initial_value
         self._lock = Lock()
         
     def increment(self, amount: int = 1) -> int:
-        """原子增加计数器值"""
-        with self._lock:
-            self._value += amount
-            return self._value
+        """增加计数器值"""
+        self._value += amount
+        return self._value
     
     def decrement(self, amount: int = 1) -> int:
-        """原子减少计数器值"""
-        with self._lock:
-            self._value -= amount
-            return self._value
+        """减少计数器值"""
+        self._value -= amount
+        return self._value
     
     def get(self) -> int:
         """获取当前值"""
-        with self._lock:
-            return self._value
+        return self._value
     
     def set(self, value: int) -> None:
         """设置计数器值"""
-        with self._lock:
-            self._value = value
+        self._value = value
     
     def reset(self) -> int:
         """重置计数器并返回之前的值"""
@@ -183,25 +256,34 @@ class AtomicCounter:
 
 
 class SimpleLRUCache(Generic[K, V]):
-    """简化的LRU缓存实现"""
+    """简化的LRU缓存实现
+    
+    读取路径不加锁：在CPython的GIL下，dict取值与OrderedDict.move_to_end都是单个C调用，
+    命中/未命中计数只用于统计，允许并发时有少量误差。写入操作仍在锁内进行。
+    """
     def __init__(self, max_size: int = 100):
         if max_size <= 0:
             raise ValueError("max_size必须大于0")
         self.max_size = max_size
         self._cache: OrderedDict[K, V] = OrderedDict()
         self._lock = RLock()
-        self._hits = AtomicCounter(0)
-        self._misses = AtomicCounter(0)
+        self._hits = 0
+        self._misses = 0
         
     def get(self, key: K) -> Optional[V]:
         """获取缓存值，更新访问时间"""
-        with self._lock:
-            if key in self._cache:
-                self._cache.move_to_end(key)
-                self._hits.increment()
-                return self._cache[key]
-            self._misses.increment()
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self._misses += 1
             return None
+        try:
+            self._cache.move_to_end(key)
+        except KeyError:
+            # 已被其他线程淘汰
+            pass
+        self._hits += 1
+        return value
     
     def put(self, key: K, value: V) -> None:
         """添加缓存值"""
@@ -224,30 +306,29 @@ class SimpleLRUCache(Generic[K, V]):
         """清空缓存"""
         with self._lock:
             self._cache.clear()
-            self._hits.set(0)
-            self._misses.set(0)
+            self._hits = 0
+            self._misses = 0
     
     def size(self) -> int:
         """获取缓存大小"""
-        with self._lock:
-            return len(self._cache)
+        return len(self._cache)
     
     def stats(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
-        with self._lock:
-            hits = self._hits.get()
-            misses = self._misses.get()
-            total = hits + misses
-            hit_rate = hits / total if total > 0 else 0.0
-            
-            return {
-                "size": len(self._cache),
-                "max_size": self.max_size,
-                "hits": hits,
-                "misses": misses,
-                "hit_rate": hit_rate,
-                "fullness": len(self._cache) / self.max_size if self.max_size > 0 else 0.0
-            }
+        hits = self._hits
+        misses = self._misses
+        size = len(self._cache)
+        total = hits + misses
+        hit_rate = hits / total if total > 0 else 0.0
+        
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hit_rate,
+            "fullness": size / self.max_size if self.max_size > 0 else 0.0
+        }
     
     def __len__(self) -> int:
         """获取缓存大小"""
@@ -255,60 +336,68 @@ class SimpleLRUCache(Generic[K, V]):
 
 
 class FileDescriptorTracker:
-    """简化的文件描述符跟踪器"""
-    def __init__(self):
-        self._lock = Lock()
+    """简化的文件描述符跟踪器
+    
+    仅作调试统计用途，计数不加锁（与 AtomicCounter 相同，并发时最大值可能略微偏小）。
+    enabled 为 False 时 track_open/track_close 替换为空操作。
+    """
+    def __init__(self, enabled: bool = True):
         self._count = 0
         self._max_count = 0
         self._opened_count = AtomicCounter(0)
         self._closed_count = AtomicCounter(0)
+        if not enabled:
+            self.track_open = self.track_close = self._noop
+    
+    @staticmethod
+    def _noop() -> None:
+        pass
     
     def track_open(self) -> None:
         """跟踪文件描述符打开"""
-        with self._lock:
-            self._count += 1
-            self._opened_count.increment()
-            if self._count > self._max_count:
-                self._max_count = self._count
+        self._opened_count.increment()
+        self._count += 1
+        if self._count > self._max_count:
+            self._max_count = self._count
     
     def track_close(self) -> None:
         """跟踪文件描述符关闭"""
-        with self._lock:
-            if self._count > 0:
-                self._count -= 1
-            self._closed_count.increment()
+        if self._count > 0:
+            self._count -= 1
+        self._closed_count.increment()
     
     def get_count(self) -> int:
         """获取当前打开的文件描述符数量"""
-        with self._lock:
-            return self._count
+        return self._count
     
     def get_stats(self) -> Dict[str, int]:
         """获取统计信息"""
-        with self._lock:
-            opened = self._opened_count.get()
-            closed = self._closed_count.get()
-            leaked = max(0, opened - closed)
-            return {
-                "current": self._count,
-                "max": self._max_count,
-                "opened": opened,
-                "closed": closed,
-                "leaked": leaked
-            }
+        opened = self._opened_count.get()
+        closed = self._closed_count.get()
+        leaked = max(0, opened - closed)
+        return {
+            "current": self._count,
+            "max": self._max_count,
+            "opened": opened,
+            "closed": closed,
+            "leaked": leaked
+        }
 
 
 class RandomFileOpener:
     def __init__(self, config: Optional[Config] = None, target_dir: Optional[str] = None) -> None:
         print("正在初始化随机文件打开器...")
         
-        # 设置工作目录
+        # 设置工作目录（只解析一次，之后各方法都使用 self.script_dir）
         try:
             if target_dir:
                 self.script_dir = Path(target_dir).resolve()
-                if not self.script_dir.exists():
+                # 一次 stat 同时检查存在性与类型
+                try:
+                    dir_stat = os.stat(self.script_dir)
+                except FileNotFoundError:
                     raise ValueError(f"目标路径不存在: {self.script_dir}")
-                if not self.script_dir.is_dir():
+                if not S_ISDIR(dir_stat.st_mode):
                     raise ValueError(f"目标路径不是目录: {self.script_dir}")
             else:
                 # 判断是否在打包环境(Frozen)下运行
@@ -372,20 +461,10 @@ class RandomFileOpener:
         except Exception as e:
             print(f"初始化缓存失败: {e}")
             self._file_hash_cache = SimpleLRUCache(max_size=50)
-            self._exclude_patterns_cache = SimpleLRUCache(max_size=100)
             self._encoding_cache = SimpleLRUCache(max_size=20)
             self._file_access_cache = SimpleLRUCache(max_size=50)
             self._file_type_cache = SimpleLRUCache(max_size=50)
         
-        # 注册退出处理
-        atexit.register(self._cleanup_all_temp_files)
-        
-        # 初始化MIME类型检测
-        try:
-            mimetypes.init()
-        except Exception:
-            pass
-        
         print("初始化完成!")
     
     def _init_basic_components(self):
@@ -396,10 +475,15 @@ class RandomFileOpener:
         self.file_operation_lock = RLock()
         self.stats_lock = Lock()
         
-        self.fd_tracker = FileDescriptorTracker()
+        # 文件描述符跟踪只在启用扩展日志时生效，避免哈希路径上的额外开销
+        self.fd_tracker = FileDescriptorTracker(enabled=self.config.enable_extended_logging)
         
-        self._temp_files = set()
-        self._temp_files_lock = Lock()
+        # 上次写入的历史记录摘要与文件修改时间，用于跳过内容未变化的保存
+        self._last_saved_history = None
+        # 内存中的历史记录，opened_files/failed_files 以集合形式保存，仅在写盘时转为列表
+        self._history: Optional[Dict[str, Any]] = None
+        self._history_mtime: Optional[int] = None
+        self._history_dirty = False
         
         self.start_time = time.time()
         self.file_operations = 0
@@ -407,9 +491,27 @@ class RandomFileOpener:
         self.total_files_scanned = AtomicCounter(0)
         self.total_files_excluded = AtomicCounter(0)
         
+        self._exclude_patterns_key = tuple(self.config.exclude_patterns)
+        self._exclude_re = self._compile_exclude_patterns(self._exclude_patterns_key)
+        
+        # 按平台选定打开文件的方法，避免每次尝试都调用 platform.system()
+        self._platform_opener = {
+            'Windows': self._open_file_windows,
+            'Darwin': self._open_file_macos,
+        }.get(platform.system(), self._open_file_linux)
+        
+        # Linux下启动时按优先级查找一次可用的打开程序
+        self._linux_openers = ()
+        if self._platform_opener == self._open_file_linux:
+            self._linux_openers = tuple(filter(None, (shutil.which(c) for c in LINUX_OPENERS)))
+        
         self._qualified_files_cache = None
         self._cache_timestamp = 0.0
         self._last_dir_mtime = None
+        # 生成缓存结果时使用的排除规则，规则变化后缓存失效
+        self._scan_rules_key = None
+        # 最近一次 get_available_files 扫描到的合格文件数，供 run 传给 show_statistics
+        self._last_qualified_count: Optional[int] = None
         
         # 初始化并发日志系统
         self._setup_logging()
@@ -427,14 +529,18 @@ class RandomFileOpener:
         # 创建Logger
         # 创建Logger
         self.logger = logging.getLogger("RandomFileOpener")
-        self.logger.setLevel(getattr(logging, self.config.log_level.upper(), logging.INFO))
+        self.logger.setLevel(LOG_LEVELS.get(self.config.log_level.upper(), logging.INFO))
         
         # 清除现有handlers，避免重复，并关闭它们以防止ResourceWarning
         if self.logger.hasHandlers():
             for handler in self.logger.handlers[:]:
+                listener = getattr(handler, 'listener', None)
+                if listener is not None:
+                    _stop_queue_listener(listener)
                 handler.close()
                 self.logger.removeHandler(handler)
         self.logger.handlers = []
+        self._log_listener = None
 
         # 格式器
         formatter = logging.Formatter(
@@ -454,20 +560,38 @@ class RandomFileOpener:
                 encoding='utf-8'
             )
             file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+
+            # 调用方只把记录放入队列，文件写入与轮转由后台监听线程完成
+            self._log_queue = queue.Queue(-1)
+            queue_handler = logging.handlers.QueueHandler(self._log_queue)
+            self._log_listener = logging.handlers.QueueListener(
+                self._log_queue, file_handler, respect_handler_level=True
+            )
+            queue_handler.listener = self._log_listener
+            self.logger.addHandler(queue_handler)
+            self._log_listener.start()
+            self._log_listener.running = True
         except Exception as e:
             print(f"无法设置日志文件 handler: {e}")
 
-        # 控制台Handler
+        # 控制台Handler直接挂在logger上，保证与 print 输出的先后顺序一致
         if self.config.log_to_console:
             console_handler = logging.StreamHandler()
             console_handler.setFormatter(formatter)
             self.logger.addHandler(console_handler)
+    
+    def _stop_log_listener(self, listener: Optional[logging.handlers.QueueListener] = None) -> None:
+        """停止日志监听线程，写完队列中剩余的记录并关闭其handlers"""
+        if listener is None:
+            listener = self._log_listener
+        if listener is not None:
+            _stop_queue_listener(listener)
 
     def log_message(self, message: str, level: str = "INFO") -> None:
         """兼容旧接口的日志方法"""
-        lvl = getattr(logging, level.upper(), logging.INFO)
-        self.logger.log(lvl, message)
+        lvl = LOG_LEVELS.get(level) or LOG_LEVELS.get(level.upper(), logging.INFO)
+        if self.logger.isEnabledFor(lvl):
+            self.logger.log(lvl, message)
 
     
     def _init_caches(self):
@@ -475,7 +599,6 @@ class RandomFileOpener:
         cache_class = SimpleLRUCache
         
         self._file_hash_cache = cache_class(max_size=self.config.hash_cache_size)
-        self._exclude_patterns_cache = cache_class(max_size=self.config.pattern_cache_size)
         self._encoding_cache = cache_class(max_size=self.config.encoding_cache_size)
         self._file_access_cache = cache_class(max_size=self.config.hash_cache_size // 2)
         self._file_type_cache = cache_class(max_size=self.config.file_type_cache_size)
@@ -491,72 +614,63 @@ class RandomFileOpener:
         except Exception as e:
             print(f"加载用户配置失败: {e}")
         return {}
-
-    
-    def _cleanup_all_temp_files(self):
-        """清理所有临时文件"""
-        try:
-            with self._temp_files_lock:
-                files_to_clean = list(self._temp_files)
-            
-            for temp_file in files_to_clean:
-                try:
-                    path = Path(temp_file)
-                    if path.exists():
-                        path.unlink()
-                except OSError:
-                    pass
-        except Exception:
-            pass
     
-
+    def log_error(self, error_message: str, *args: Any) -> None:
+        """记录错误信息，args 按 % 格式延迟格式化"""
+        self.logger.error(error_message, *args)
     
+    def log_warning(self, warning_message: str, *args: Any) -> None:
+        """记录警告信息，args 按 % 格式延迟格式化"""
+        self.logger.warning(warning_message, *args)
     
-    def log_error(self, error_message: str) -> None:
-        """记录错误信息"""
-        self.logger.error(error_message)
-    
-    def log_warning(self, warning_message: str) -> None:
-        """记录警告信息"""
-        self.logger.warning(warning_message)
-    
-    def log_debug(self, debug_message: str) -> None:
-        """记录调试信息"""
-        self.logger.debug(debug_message)
+    def log_debug(self, debug_message: str, *args: Any) -> None:
+        """记录调试信息，args 按 % 格式延迟格式化"""
+        self.logger.debug(debug_message, *args)
     
     def get_file_hash(self, filepath: Union[str, Path]) -> str:
         """计算文件的哈希值"""
         path = Path(filepath)
-        if not path.exists():
+        try:
+            stat = path.stat()
+        except OSError:
             return ""
         
+        # (大小, 纳秒修改时间, inode) 已足以判断文件是否变化，无需读取文件内容
+        fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}:{stat.st_ino}"
+        hash_mode = self.config.hash_mode
+        if hash_mode == "fingerprint":
+            return fingerprint
+        
         try:
-            self.performance_stats["hash_calculations"].increment()
-            
             # 检查缓存
-            # Use string conversion for cache key and logging
-            str_path = str(path)
-            stat = path.stat()
-            cache_key = f"{str_path}_{stat.st_size}_{stat.st_mtime}"
+            str_path = os.fspath(path)
+            cache_key = f"{str_path}:{fingerprint}"
             cached_result = self._file_hash_cache.get(cache_key)
             if cached_result:
                 return cached_result
             
+            self.performance_stats["hash_calculations"].increment()
             file_size = stat.st_size
-            file_hash = hashlib.sha256()
             
-            if file_size <= self.config.max_file_size_for_full_hash:
-                with open(path, 'rb') as f:
+            if hash_mode != "sampling" and file_size <= self.config.max_file_size_for_full_hash:
+                # 不使用BufferedReader：下面按大块readinto读取，额外的缓冲层只会多一次内存复制
+                with open(path, 'rb', buffering=0) as f:
                     self.fd_tracker.track_open()
                     try:
-                        while True:
-                            chunk = f.read(8192)
-                            if not chunk:
-                                break
-                            file_hash.update(chunk)
+                        file_hash = self._new_hasher(file_size)
+                        if HAS_FILE_DIGEST:
+                            hash_result = hashlib.file_digest(f, lambda: file_hash).hexdigest()
+                        else:
+                            buf = bytearray(self.config.hash_block_size)
+                            view = memoryview(buf)
+                            while True:
+                                size = f.readinto(buf)
+                                if not size:
+                                    break
+                                file_hash.update(view[:size])
+                            hash_result = file_hash.hexdigest()
                     finally:
                         self.fd_tracker.track_close()
-                hash_result = file_hash.hexdigest()
             else:
                 # 抽样哈希
                 hash_result = self._get_sampling_hash(filepath, file_size)
@@ -566,131 +680,219 @@ class RandomFileOpener:
             
             return hash_result
         except Exception as e:
-            self.log_error(f"获取文件哈希失败 ({filepath}): {e}")
+            self.log_error("获取文件哈希失败 (%s): %s", filepath, e)
             return ""
     
+    @staticmethod
+    def _new_hasher(file_size: int = 0) -> Any:
+        """创建文件哈希对象，优先使用blake3，未安装时回退到SHA-256"""
+        if blake3 is None:
+            return hashlib.sha256()
+        if file_size > BLAKE3_THREADING_THRESHOLD:
+            return blake3.blake3(max_threads=blake3.blake3.AUTO)
+        return blake3.blake3()
+    
     def _get_sampling_hash(self, filepath: str, file_size: int) -> str:
         """对大文件使用抽样哈希算法"""
         try:
-            file_hash = hashlib.sha256()
+            file_hash = self._new_hasher()
+            
+            # 预分配缓冲区，所有样本都读入同一块内存，避免每次读取分配新的bytes对象；
+            # 不使用 mmap：文件在读取期间被截断时访问映射会触发 SIGBUS 使进程崩溃
+            buf = bytearray(65536)
+            view = memoryview(buf)
             
-            with open(filepath, 'rb') as f:
+            with open(filepath, 'rb', buffering=0) as f:
                 self.fd_tracker.track_open()
                 try:
                     # 读取文件开头
-                    start_data = f.read(65536)
-                    if start_data:
-                        file_hash.update(start_data)
+                    size = f.readinto(buf)
+                    if size:
+                        file_hash.update(view[:size])
                     
                     # 读取多个样本点
                     sample_count = min(8, max(3, file_size // (5 * 1024 * 1024)))
                     for i in range(sample_count):
                         pos = int((i / (sample_count - 1)) * file_size) if sample_count > 1 else file_size // 2
                         f.seek(max(0, pos - 8192))
-                        sample_data = f.read(16384)
-                        if sample_data:
-                            file_hash.update(sample_data)
+                        size = f.readinto(view[:16384])
+                        if size:
+                            file_hash.update(view[:size])
                     
                     # 读取文件结尾
                     if file_size > 65536:
                         f.seek(max(0, file_size - 65536))
-                        end_data = f.read(65536)
-                        if end_data:
-                            file_hash.update(end_data)
+                        size = f.readinto(buf)
+                        if size:
+                            file_hash.update(view[:size])
                 finally:
                     self.fd_tracker.track_close()
             
             return file_hash.hexdigest()
         except Exception as e:
-            self.log_error(f"计算抽样哈希失败 ({filepath}): {e}")
+            self.log_error("计算抽样哈希失败 (%s): %s", filepath, e)
             return ""
     
+    @staticmethod
+    def _compile_exclude_patterns(patterns: List[str]) -> Optional["re.Pattern"]:
+        """将排除模式预编译为单个正则表达式，匹配语义与逐个检查模式时一致"""
+        # fnmatch.fnmatch 在Windows上不区分大小写
+        fnmatch_group = '(?i:' if os.name == 'nt' else '(?:'
+        parts = []
+        for pattern in patterns:
+            if not pattern:
+                continue
+            if pattern.startswith("*."):
+                # 扩展名模式: 不区分大小写的后缀匹配
+                parts.append(f"(?i:.*{re.escape(pattern[1:])}\\Z)")
+            else:
+                # 其他模式: 子串匹配，含通配符时再按fnmatch规则匹配
+                parts.append(f".*{re.escape(pattern)}")
+                if "*" in pattern or "?" in pattern:
+                    parts.append(f"{fnmatch_group}{fnmatch.translate(pattern)})")
+        if not parts:
+            return None
+        return re.compile("(?s:" + "|".join(parts) + ")")
+    
+    def _get_exclude_re(self) -> Optional["re.Pattern"]:
+        """返回编译好的排除模式，配置中的 exclude_patterns 被修改（包括原地修改）后重新编译"""
+        key = tuple(self.config.exclude_patterns)
+        if key != self._exclude_patterns_key:
+            self._exclude_re = self._compile_exclude_patterns(key)
+            self._exclude_patterns_key = key
+        return self._exclude_re
+    
+    @staticmethod
+    def _exclude_reason(name: str, target: Any,
+                        is_file: Callable[[Any], bool], is_symlink: Callable[[Any], bool],
+                        exclude_match: Optional[Callable[[str], Any]],
+                        exec_ext_set: frozenset, exclude_symlinks: bool) -> Optional[str]:
+        """排除规则的唯一实现，返回排除原因，不排除时返回 None
+        
+        is_file(target) / is_symlink(target) 只在名称规则都通过后才调用，访问失败时由调用方处理 OSError。
+        配置项由调用方传入，扫描时可在开始前绑定一次。
+        """
+        if name.startswith(('.', '~')):
+            return "隐藏文件"
+        if exclude_match is not None and exclude_match(name):
+            return "匹配排除模式"
+        if os.path.splitext(name)[1].lower() in exec_ext_set:
+            return "系统可执行文件"
+        if not is_file(target):
+            return "不是文件"
+        if exclude_symlinks and is_symlink(target):
+            return "符号链接"
+        return None
+    
     def should_exclude(self, filename: str, filepath: Union[str, Path]) -> Tuple[bool, Optional[str]]:
-        """判断文件是否应该被排除"""
+        """判断文件是否应该被排除
+        
+        不检查读权限：它与之后的打开操作之间存在竞争，无法读取的文件会在打开时失败。
+        """
         if not filename:
             return True, "文件名为空"
         
-        path = Path(filepath)
-        
-        # 检查是否是隐藏文件
-        if filename.startswith('.') or filename.startswith('~'):
-            return True, "隐藏文件"
-        
-        # 检查排除模式
-        for pattern in self.config.exclude_patterns:
-            if not pattern:
-                continue
-            
-            if pattern.startswith("*."):
-                ext_pattern = pattern[1:].lower()
-                if filename.lower().endswith(ext_pattern):
-                    return True, "匹配排除模式"
-            elif pattern in filename:
-                return True, "匹配排除模式"
-            elif "*" in pattern or "?" in pattern:
-                if fnmatch.fnmatch(filename, pattern):
-                    return True, "匹配排除模式"
-        
-        # 检查是否是系统可执行文件
-        for ext in self.config.system_executable_extensions:
-            if filename.lower().endswith(ext):
-                return True, "系统可执行文件"
-        
-        # 检查文件是否可访问
+        exclude_re = self._get_exclude_re()
         try:
-            if not path.exists():
-                return True, "文件不存在"
-            if not path.is_file():
-                return True, "不是文件"
-            if not os.access(path, os.R_OK): # os.access works with Path
-                return True, "文件不可读"
-            if self.config.exclude_symlinks and path.is_symlink():
-                return True, "符号链接"
+            reason = self._exclude_reason(
+                filename, filepath,
+                lambda p: S_ISREG(os.stat(p).st_mode), os.path.islink,
+                exclude_re.match if exclude_re is not None else None,
+                self.config._exec_ext_set, self.config.exclude_symlinks,
+            )
+        except FileNotFoundError:
+            return True, "文件不存在"
         except Exception as e:
             return True, f"文件访问错误: {e}"
         
-        return False, None
+        return reason is not None, reason
+    
+    def _make_entry_classifier(self) -> Callable[[os.DirEntry], Tuple[str, bool]]:
+        """生成本次扫描使用的目录项判断函数，返回值为 (文件名, 是否保留)
+        
+        规则由 _exclude_reason 判断，文件类型取自 os.scandir 缓存的信息，不再额外调用 stat。
+        配置项、规则函数和计数器方法在扫描开始时绑定为默认参数，循环中只做局部变量访问。
+        """
+        exclude_re = self._get_exclude_re()
+        exclude_match = exclude_re.match if exclude_re is not None else None
+        
+        def classify(entry: os.DirEntry,
+                     _reason=self._exclude_reason,
+                     _match=exclude_match,
+                     _exec_ext_set=self.config._exec_ext_set,
+                     _exclude_symlinks=self.config.exclude_symlinks,
+                     _is_file=os.DirEntry.is_file,
+                     _is_symlink=os.DirEntry.is_symlink,
+                     _scanned_inc=self.total_files_scanned.increment,
+                     _excluded_inc=self.total_files_excluded.increment) -> Tuple[str, bool]:
+            name = entry.name
+            try:
+                if not _is_file(entry):
+                    return name, False
+            except OSError:
+                return name, False
+            
+            _scanned_inc()
+            
+            try:
+                reason = _reason(name, entry, _is_file, _is_symlink, _match,
+                                 _exec_ext_set, _exclude_symlinks)
+            except OSError:
+                reason = "文件访问错误"
+            if reason is not None:
+                _excluded_inc()
+                return name, False
+            return name, True
+        
+        return classify
     
     def scan_qualified_files(self, force_refresh: bool = False) -> Tuple[List[str], bool, Optional[str]]:
-        """扫描当前目录中符合条件的文件"""
+        """扫描当前目录中符合条件的文件
+        
+        缓存过期后先比较目录的修改时间：目录项增删改名都会更新它，未变化时沿用上次结果。
+        排除规则同样是缓存键的一部分，修改配置后会重新扫描。
+        """
         current_time = time.time()
         
+        self._get_exclude_re()
+        rules_key = (self._exclude_patterns_key, self.config.exclude_symlinks, self.config._exec_ext_set)
+        
+        with self.cache_lock:
+            if (not force_refresh and
+                self._qualified_files_cache is not None and
+                rules_key == self._scan_rules_key):
+                if (current_time - self._cache_timestamp) < self.config.cache_ttl:
+                    return self._qualified_files_cache, True, None
+        
+        try:
+            dir_mtime = os.stat(self.script_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        
         with self.cache_lock:
-            if (not force_refresh and 
-                self._qualified_files_cache is not None and 
-                (current_time - self._cache_timestamp) < self.config.cache_ttl):
+            if (not force_refresh and
+                self._qualified_files_cache is not None and
+                rules_key == self._scan_rules_key and
+                dir_mtime is not None and
+                dir_mtime == self._last_dir_mtime):
+                self._cache_timestamp = current_time
                 return self._qualified_files_cache, True, None
         
         qualified_files = []
         
         try:
-            # 检查目录是否可访问
-            if not os.access(self.script_dir, os.R_OK):
-                return [], False, f"目录不可访问: {self.script_dir}"
-            
-            if not self.script_dir.exists():
+            # 不预先用 os.access/exists 检查目录，直接由 scandir 的异常区分错误，省去两次系统调用
+            try:
+                with os.scandir(self.script_dir) as files_in_dir:
+                    entries = list(files_in_dir)
+            except FileNotFoundError:
                 return [], False, f"目录不存在: {self.script_dir}"
+            except PermissionError:
+                return [], False, f"目录不可访问: {self.script_dir}"
             
-            # os.scandir accepts Path objects
-            with os.scandir(self.script_dir) as files_in_dir:
-                for entry in files_in_dir:
-                    try:
-                        if not entry.is_file():
-                            continue
-                        
-                        self.total_files_scanned.increment()
-                        item = entry.name
-                        item_path = entry.path
-                    except OSError:
-                        continue
-                    
-                    exclude, reason = self.should_exclude(item, item_path)
-                    if exclude:
-                        self.total_files_excluded.increment()
-                        continue
-                    
-                    qualified_files.append(item)
-
+            # 判断只使用 DirEntry 缓存的类型信息，没有I/O可以重叠，直接顺序处理
+            classify = self._make_entry_classifier()
+            qualified_files = [name for name, keep in map(classify, entries) if keep]
                 
         except Exception as e:
             error_msg = f"扫描文件时出错: {e}"
@@ -700,14 +902,16 @@ class RandomFileOpener:
         with self.cache_lock:
             self._qualified_files_cache = qualified_files
             self._cache_timestamp = current_time
+            self._last_dir_mtime = dir_mtime
+            self._scan_rules_key = rules_key
         
         return qualified_files, True, None
     
     def load_history(self) -> Dict[str, Any]:
         """加载历史记录"""
         default_history = {
-            "opened_files": [],
-            "failed_files": [],
+            "opened_files": set(),
+            "failed_files": set(),
             "file_signatures": {},
             "statistics": {
                 "total_opened": 0,
@@ -724,9 +928,22 @@ class RandomFileOpener:
         
         with self.history_lock:
             try:
-                if self.history_file.exists():
-                    with open(self.history_file, 'r', encoding='utf-8') as f:
-                        loaded = json.load(f)
+                mtime = self.history_file.stat().st_mtime_ns
+            except OSError:
+                mtime = None
+            
+            # 有未保存的修改，或文件自上次读写后未变化时直接复用内存中的记录
+            if self._history is not None and (self._history_dirty or mtime == self._history_mtime):
+                return self._history
+            
+            self._history = default_history
+            self._history_mtime = mtime
+            self._history_dirty = False
+            
+            try:
+                if mtime is not None:
+                    with open(self.history_file, 'rb') as f:
+                        loaded = self._deserialize_history(f.read())
                     
                     # 验证和修复历史记录结构
                     if not isinstance(loaded, dict):
@@ -742,6 +959,11 @@ class RandomFileOpener:
                         if key not in loaded["statistics"]:
                             loaded["statistics"][key] = default_history["statistics"][key]
                     
+                    # 同一文件只属于其中一个集合（run 中也保持这一点），旧记录中重复的按已打开处理
+                    loaded["opened_files"] = set(loaded["opened_files"])
+                    loaded["failed_files"] = set(loaded["failed_files"]) - loaded["opened_files"]
+                    
+                    self._history = loaded
                     return loaded
                     
             except Exception as e:
@@ -750,61 +972,109 @@ class RandomFileOpener:
         
         return default_history
     
+    @staticmethod
+    def _history_default(obj: Any) -> Any:
+        """序列化时将集合转为排序后的列表，保证输出稳定"""
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    
+    @staticmethod
+    def _serialize_history(history: Dict[str, Any]) -> bytes:
+        """将历史记录序列化为UTF-8字节，优先使用orjson"""
+        default = RandomFileOpener._history_default
+        if orjson is not None:
+            return orjson.dumps(history, default=default,
+                                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        # 不使用indent，标准库可以走更快的C编码器
+        return json.dumps(history, ensure_ascii=False, separators=(',', ':'),
+                          default=default).encode('utf-8')
+    
+    @staticmethod
+    def _deserialize_history(data: bytes) -> Any:
+        """解析历史记录文件内容，优先使用orjson"""
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+    
     def save_history(self, history: Dict[str, Any]) -> None:
         """保存历史记录"""
+        temp_file = None
         try:
+            payload = self._serialize_history(history)
+            digest = hashlib.blake2b(payload, digest_size=16).digest()
+            
             with self.history_lock:
+                # 内容与上次写入相同且文件未被其他进程修改时跳过
+                if self._last_saved_history is not None:
+                    try:
+                        if (digest, self.history_file.stat().st_mtime_ns) == self._last_saved_history:
+                            self._history = history
+                            self._history_dirty = False
+                            return
+                    except OSError:
+                        pass
+                
                 # 确保目录存在
                 self.history_file.parent.mkdir(parents=True, exist_ok=True)
                 
-                # 创建临时文件
-                temp_file = f"{self.history_file}.tmp.{int(time.time())}.{os.getpid()}"
-                
-                with self._temp_files_lock:
-                    self._temp_files.add(temp_file)
-                
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump(history, f, ensure_ascii=False, indent=2)
-                
-                # 原子性地替换原文件
-                if self.history_file.exists():
+                if self.config.atomic_history_write:
+                    # 创建临时文件，路径只在本次调用中使用，由下方finally负责清理
+                    temp_file = f"{self.history_file}.tmp.{int(time.time())}.{os.getpid()}"
+                    
+                    with open(temp_file, 'wb') as f:
+                        f.write(payload)
+                    
+                    # 原子性地替换原文件
                     os.replace(temp_file, self.history_file)
+                    temp_file = None
                 else:
-                    os.rename(temp_file, self.history_file)
+                    with open(self.history_file, 'wb') as f:
+                        f.write(payload)
+                        f.flush()
+                        os.fsync(f.fileno())
+                
+                mtime = self.history_file.stat().st_mtime_ns
+                self._last_saved_history = (digest, mtime)
+                self._history = history
+                self._history_mtime = mtime
+                self._history_dirty = False
                     
         except Exception as e:
             self.log_error(f"保存历史记录失败: {e}")
         finally:
-            # 清理临时文件
-            try:
-                with self._temp_files_lock:
-                    if temp_file in self._temp_files:
-                        self._temp_files.remove(temp_file)
-                if os.path.exists(temp_file):
-                        os.remove(temp_file)
-            except:
-                pass
+            # 写入或替换失败时清理临时文件
+            if temp_file is not None:
+                try:
+                    os.unlink(temp_file)
+                except OSError:
+                    pass
+    
+    def flush_history(self) -> None:
+        """保存 run(defer_save=True) 累积在内存中的历史记录修改"""
+        with self.history_lock:
+            history = self._history if self._history_dirty else None
+        if history is not None:
+            self.save_history(history)
     
     def get_available_files(self) -> Tuple[List[str], Dict[str, Any], bool, Optional[str]]:
         """获取可用的文件列表"""
         history = self.load_history()
         
-        opened_files = set(history.get("opened_files", []))
-        failed_files = set(history.get("failed_files", []))
+        # 每次扫描只计算一次已处理文件的并集
+        processed_files = history["opened_files"] | history["failed_files"]
         
         all_qualified_files, success, error_msg = self.scan_qualified_files()
         
         if not success:
             return [], history, False, error_msg
         
+        self._last_qualified_count = len(all_qualified_files)
+        
         if not all_qualified_files:
             self.log_warning(f"在目录中未找到符合条件的文件: {self.script_dir}")
         
-        available_files = []
-        for filename in all_qualified_files:
-            if filename in opened_files or filename in failed_files:
-                continue
-            available_files.append(filename)
+        available_files = [f for f in all_qualified_files if f not in processed_files]
         
         return available_files, history, True, None
     
@@ -834,13 +1104,26 @@ class RandomFileOpener:
     def _open_file_linux(self, filepath: Union[str, Path], filename: str) -> bool:
         """Linux系统下打开文件"""
         str_path = str(filepath)
-        methods = [['xdg-open', str_path], ['gnome-open', str_path], ['kde-open', str_path]]
+        # 启动时已解析出路径的打开程序用 posix_spawn 启动，它不复制父进程地址空间，比 fork+exec 更快
+        openers = self._linux_openers
+        spawn = getattr(os, 'posix_spawn', None) if openers else None
+        devnull = subprocess.DEVNULL
         
-        for method in methods:
+        # 依次尝试各个打开程序，退出状态非零时换下一个
+        for opener in openers or LINUX_OPENERS:
             try:
-                result = subprocess.run(method, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                if result.returncode == 0:
-                    return True
+                if spawn is not None:
+                    pid = spawn(opener, [opener, str_path], os.environ, file_actions=[
+                        (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                        (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+                    ])
+                    _, status = os.waitpid(pid, 0)
+                    if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                        return True
+                else:
+                    result = subprocess.run([opener, str_path], check=False, stdout=devnull, stderr=devnull)
+                    if result.returncode == 0:
+                        return True
             except (OSError, subprocess.SubprocessError):
                 continue
         
@@ -855,15 +1138,7 @@ class RandomFileOpener:
                 if attempt > 0:
                     self.log_message(f"重试打开文件: {filename} (第{attempt + 1}次)")
                 
-                system = platform.system()
-                success = False
-                
-                if system == 'Windows':
-                    success = self._open_file_windows(filepath, filename)
-                elif system == 'Darwin':
-                    success = self._open_file_macos(filepath, filename)
-                else:
-                    success = self._open_file_linux(filepath, filename)
+                success = self._platform_opener(filepath, filename)
                 
                 if success:
                     self.log_message(f"成功打开文件: {filename}")
@@ -873,17 +1148,18 @@ class RandomFileOpener:
                     time.sleep(0.3 * (attempt + 1))
                     
             except Exception as e:
-                self.log_error(f"打开文件失败 ({filename}, 第{attempt + 1}次): {e}")
+                self.log_error("打开文件失败 (%s, 第%d次): %s", filename, attempt + 1, e)
                 if attempt < self.config.max_retries - 1:
                     time.sleep(0.3 * (attempt + 1))
         
-        self.log_error(f"无法打开文件: {filename} (已尝试{self.config.max_retries}次)")
+        self.log_error("无法打开文件: %s (已尝试%d次)", filename, self.config.max_retries)
         return False
     
     def reset_history_if_needed(self, history: Dict[str, Any], available_files: List[str]) -> Tuple[List[str], Dict[str, Any]]:
         """如果需要，自动重置历史记录"""
         if not available_files:
-            all_qualified_files, success, error_msg = self.scan_qualified_files(force_refresh=True)
+            # 调用方刚扫描过目录，缓存在目录修改时间变化时会自动失效，无需强制重新扫描
+            all_qualified_files, success, error_msg = self.scan_qualified_files()
             
             if not success:
                 self.log_error(f"扫描目录失败，无法重置历史记录: {error_msg}")
@@ -898,8 +1174,8 @@ class RandomFileOpener:
                 stats["total_resets"] = stats.get("total_resets", 0) + 1
                 
                 new_history = {
-                    "opened_files": [],
-                    "failed_files": [],
+                    "opened_files": set(),
+                    "failed_files": set(),
                     "file_signatures": {},
                     "statistics": stats
                 }
@@ -911,66 +1187,98 @@ class RandomFileOpener:
                     self._qualified_files_cache = None
                 
                 self._file_hash_cache.clear()
-                self._exclude_patterns_cache.clear()
                 self._encoding_cache.clear()
                 self._file_access_cache.clear()
                 self._file_type_cache.clear()
                 
+                self._last_qualified_count = len(all_qualified_files)
                 return all_qualified_files, new_history
             else:
                 self.log_message("没有可用的文件")
         
         return available_files, history
     
-    def show_statistics(self, history: Dict[str, Any]) -> None:
-        """显示统计信息"""
-        opened_files = history.get("opened_files", [])
-        failed_files = history.get("failed_files", [])
+    def show_statistics(self, history: Dict[str, Any], total_qualified: Optional[int] = None) -> None:
+        """显示统计信息
+        
+        total_qualified 为调用方已扫描得到的合格文件数，传入时不再重新扫描目录。
+        """
+        opened_files = history.get("opened_files", set())
+        failed_files = history.get("failed_files", set())
         stats = history.get("statistics", {})
         
         opened_count = len(opened_files)
         failed_count = len(failed_files)
         
-        all_qualified_files, success, _ = self.scan_qualified_files()
-        
-        if not success:
-            self.log_error("无法获取统计信息")
-            return
-        
-        total_count = len(all_qualified_files)
+        if total_qualified is None:
+            all_qualified_files, success, _ = self.scan_qualified_files()
+            
+            if not success:
+                self.log_error("无法获取统计信息")
+                return
+            
+            total_qualified = len(all_qualified_files)
         
-        opened_set = set(opened_files)
-        failed_set = set(failed_files)
-        processed_files = opened_set.union(failed_set)
+        total_count = total_qualified
         
-        remaining_count = total_count - len(processed_files)
+        # 两个集合互不相交，已处理数即两者大小之和，无需构造并集
+        remaining_count = total_count - opened_count - failed_count
         
         run_time = time.time() - self.start_time
         
-        self.log_message("=" * 60)
-        self.log_message("统计信息")
-        self.log_message("=" * 60)
-        self.log_message(f"已成功打开文件数: {opened_count}")
-        self.log_message(f"打开失败文件数: {failed_count}")
-        self.log_message(f"目录中文件总数: {total_count}")
-        self.log_message(f"剩余可打开文件数: {remaining_count}")
-        self.log_message("-" * 60)
-        self.log_message(f"累计成功打开: {stats.get('total_opened', 0)}")
-        self.log_message(f"累计打开失败: {stats.get('total_failed', 0)}")
-        self.log_message(f"总重置次数: {stats.get('total_resets', 0)}")
-        self.log_message("-" * 60)
-        self.log_message(f"程序运行时间: {run_time:.2f}秒")
-        self.log_message(f"文件操作次数: {self.file_operations}")
-        self.log_message(f"文件扫描次数: {self.total_files_scanned.get()}")
-        self.log_message(f"文件排除次数: {self.total_files_excluded.get()}")
+        # 整块统计信息拼成一条日志记录输出，避免逐行分发与写入
+        lines = [
+            "=" * 60,
+            "统计信息",
+            "=" * 60,
+            f"已成功打开文件数: {opened_count}",
+            f"打开失败文件数: {failed_count}",
+            f"目录中文件总数: {total_count}",
+            f"剩余可打开文件数: {remaining_count}",
+            "-" * 60,
+            f"累计成功打开: {stats.get('total_opened', 0)}",
+            f"累计打开失败: {stats.get('total_failed', 0)}",
+            f"总重置次数: {stats.get('total_resets', 0)}",
+            "-" * 60,
+            f"程序运行时间: {run_time:.2f}秒",
+            f"文件操作次数: {self.file_operations}",
+            f"文件扫描次数: {self.total_files_scanned.get()}",
+            f"文件排除次数: {self.total_files_excluded.get()}",
+        ]
         
         if stats.get("last_opened_file"):
-            self.log_message(f"上次打开文件: {stats['last_opened_file']}")
+            lines.append(f"上次打开文件: {stats['last_opened_file']}")
         
-        self.log_message("=" * 60)
+        lines.append("=" * 60)
+        self.log_message("\n".join(lines))
     
-    def run(self) -> None:
-        """主程序 - 自动随机打开文件"""
+    def _record_result(self, history: Dict[str, Any], filename: str, success: bool) -> None:
+        """把文件记入成功或失败集合，并从另一个集合中移除"""
+        win, lose = ("opened_files", "failed_files") if success else ("failed_files", "opened_files")
+        history.setdefault(win, set()).add(filename)
+        history.setdefault(lose, set()).discard(filename)
+        self._history_dirty = True
+    
+    def pick_files(self, count: int) -> List[str]:
+        """一次扫描中随机选出最多 count 个互不重复的可用文件，供批量打开使用"""
+        available_files, history, success, error_msg = self.get_available_files()
+        if not success:
+            self.log_error(f"无法获取可用文件: {error_msg}")
+            return []
+        
+        available_files, history = self.reset_history_if_needed(history, available_files)
+        return random.sample(available_files, min(count, len(available_files)))
+    
+    def run_one(self, filename: str, defer_save: bool = False) -> None:
+        """打开指定的文件并记录结果，跳过扫描与随机选择"""
+        self.run(defer_save=defer_save, selected_file=filename)
+    
+    def run(self, defer_save: bool = False, selected_file: Optional[str] = None) -> None:
+        """主程序 - 自动随机打开文件
+        
+        defer_save 为 True 时历史记录只在内存中更新，由调用方在批量结束后调用 flush_history 保存。
+        selected_file 为 pick_files 预先选出的文件，传入时不再扫描目录。
+        """
         try:
             self.log_message("=" * 60)
             self.log_message("随机文件打开器 - 自动模式")
@@ -982,50 +1290,35 @@ class RandomFileOpener:
             print(f"初始化日志失败: {e}")
         
         try:
-            # 获取可用文件
-            available_files, history, success, error_msg = self.get_available_files()
-            
-            if not success:
-                self.log_error(f"无法获取可用文件: {error_msg}")
-                self.log_message("程序无法继续执行")
-                return
-            
-            # 如果没有可用文件，自动重置历史记录
-            available_files, history = self.reset_history_if_needed(history, available_files)
-            
-            if not available_files:
-                self.log_message("错误: 没有可用的文件可以打开")
-                self.show_statistics(history)
-                return
-            
-            # 随机选择一个文件
-            selected_file = random.choice(available_files)
+            if selected_file is not None:
+                history = self.load_history()
+            else:
+                # 获取可用文件
+                self._last_qualified_count = None
+                available_files, history, success, error_msg = self.get_available_files()
+                
+                if not success:
+                    self.log_error(f"无法获取可用文件: {error_msg}")
+                    self.log_message("程序无法继续执行")
+                    return
+                
+                # 如果没有可用文件，自动重置历史记录
+                available_files, history = self.reset_history_if_needed(history, available_files)
+                
+                if not available_files:
+                    self.log_message("错误: 没有可用的文件可以打开")
+                    self.show_statistics(history, self._last_qualified_count)
+                    return
+                
+                # 随机选择一个文件
+                selected_file = random.choice(available_files)
             self.log_message(f"随机选择文件: {selected_file}")
             
             # 尝试打开文件
             success = self.open_file_with_retry(selected_file)
             
             # 更新历史记录
-            if success:
-                opened_files = history.get("opened_files", [])
-                if selected_file not in opened_files:
-                    opened_files.append(selected_file)
-                    history["opened_files"] = opened_files
-                
-                failed_files = history.get("failed_files", [])
-                if selected_file in failed_files:
-                    failed_files.remove(selected_file)
-                    history["failed_files"] = failed_files
-            else:
-                failed_files = history.get("failed_files", [])
-                if selected_file not in failed_files:
-                    failed_files.append(selected_file)
-                    history["failed_files"] = failed_files
-                
-                opened_files = history.get("opened_files", [])
-                if selected_file in opened_files:
-                    opened_files.remove(selected_file)
-                    history["opened_files"] = opened_files
+            self._record_result(history, selected_file, success)
             
             # 更新统计信息
             stats = history.get("statistics", {})
@@ -1040,21 +1333,22 @@ class RandomFileOpener:
             history["statistics"] = stats
             
             # 保存历史记录
-            self.save_history(history)
+            if not defer_save:
+                self.save_history(history)
             
-            # 显示统计信息
-            self.show_statistics(history)
+            # 显示统计信息（复用本次扫描的文件总数）
+            self.show_statistics(history, self._last_qualified_count)
             
         except KeyboardInterrupt:
             self.log_message("程序被用户中断")
+            if defer_save:
+                # 批量模式下交给调用方结束循环并保存已累积的历史记录
+                raise
         except Exception as e:
             self.log_error(f"程序执行过程中发生未预期错误: {e}")
-            import traceback
             self.log_error(traceback.format_exc())
         
         finally:
-            self._cleanup_all_temp_files()
-            
             fd_stats = self.fd_tracker.get_stats()
             if fd_stats['leaked'] > 0:
                 self.log_warning(f"检测到可能的文件描述符泄漏: {fd_stats['leaked']}个未关闭")
@@ -1154,6 +1448,18 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+def _delete_registry_tree(root: Any, key_path: str) -> None:
+    """先删除所有子键再删除自身（winreg.DeleteKey 不能删除含子键的项）"""
+    with winreg.OpenKey(root, key_path, 0, winreg.KEY_READ | winreg.KEY_WRITE) as key:
+        while True:
+            try:
+                sub_key = winreg.EnumKey(key, 0)
+            except OSError:
+                break
+            _delete_registry_tree(key, sub_key)
+    winreg.DeleteKey(root, key_path)
+
+
 def manage_context_menu(action: str) -> None:
     """管理Windows右键菜单注册"""
     if platform.system() != "Windows":
@@ -1182,30 +1488,22 @@ def manage_context_menu(action: str) -> None:
 
     try:
         if action == "register":
+            icon = sys.executable if getattr(sys, 'frozen', False) else "shell32.dll,3"
             for key_path in keys:
-                # 创建主键
-                key = winreg.CreateKey(winreg.HKEY_CURRENT_USER, key_path)
-                winreg.SetValue(key, "", winreg.REG_SZ, menu_name)
-                winreg.SetValueEx(key, "Icon", 0, winreg.REG_SZ, sys.executable if getattr(sys, 'frozen', False) else "shell32.dll,3")
-                
-                # 创建 command 子键
-                cmd_key = winreg.CreateKey(key, "command")
-                winreg.SetValue(cmd_key, "", winreg.REG_SZ, command)
-                winreg.CloseKey(cmd_key)
-                winreg.CloseKey(key)
+                # 每个主键只打开一次，名称、图标和 command 子键都通过同一个句柄写入
+                with winreg.CreateKeyEx(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_WRITE) as key:
+                    winreg.SetValue(key, "", winreg.REG_SZ, menu_name)
+                    winreg.SetValueEx(key, "Icon", 0, winreg.REG_SZ, icon)
+                    # SetValue 会自动创建 command 子键并写入其默认值
+                    winreg.SetValue(key, "command", winreg.REG_SZ, command)
             print(f"成功注册右键菜单: {menu_name}")
             print("现在您可以在任意文件夹上点击右键使用了。")
             
         elif action == "unregister":
             for key_path in keys:
                 try:
-                    # 递归删除比较麻烦，winreg没有DeleteKeyTree
-                    # 这里必须先删 command 再删主键
-                    try:
-                        winreg.DeleteKey(winreg.HKEY_CURRENT_USER, key_path +r"\command")
-                    except FileNotFoundError:
-                        pass
-                    winreg.DeleteKey(winreg.HKEY_CURRENT_USER, key_path)
+                    # winreg没有DeleteKeyTree，枚举子键从叶子开始逐层删除
+                    _delete_registry_tree(winreg.HKEY_CURRENT_USER, key_path)
                 except FileNotFoundError:
                     pass
                 except Exception as e:
@@ -1230,9 +1528,12 @@ def main() -> None:
         manage_context_menu("unregister")
         sys.exit(0)
     
+    # 默认配置只构造一次，供下方读取默认文件名与默认值
+    default_config = Config()
+    
     # 0. 处理初始化配置请求
     if args.init_config:
-        config_filename = Config().config_filename
+        config_filename = default_config.config_filename
         # 在当前工作目录生成
         target_path = Path.cwd() / config_filename
         
@@ -1244,9 +1545,8 @@ def main() -> None:
                     print("操作已取消")
                     sys.exit(0)
             
-            default_config = Config().to_dict()
             with open(target_path, 'w', encoding='utf-8') as f:
-                json.dump(default_config, f, ensure_ascii=False, indent=4)
+                json.dump(default_config.to_dict(), f, ensure_ascii=False, indent=4)
             print(f"成功生成默认配置文件: {target_path}")
             print("您可以修改此文件来自定义程序行为。")
         except Exception as e:
@@ -1266,11 +1566,11 @@ def main() -> None:
         
     try:
         # 1. 初始默认配置
-        config_dict = Config().to_dict()
+        config_dict = default_config.to_dict()
         
         # 2. 如果存在配置文件，加载并覆盖
         # 使用Config类定义的默认配置文件名
-        config_filename = Config().config_filename
+        config_filename = default_config.config_filename
         config_file_path = target_dir / config_filename
         if config_file_path.exists():
             try:
@@ -1324,8 +1624,8 @@ def main() -> None:
             stats["total_resets"] = stats.get("total_resets", 0) + 1
             
             new_history = {
-                "opened_files": [],
-                "failed_files": [],
+                "opened_files": set(),
+                "failed_files": set(),
                 "file_signatures": {},
                 "statistics": stats
             }
@@ -1336,28 +1636,41 @@ def main() -> None:
             
     except Exception as e:
         print(f"初始化程序失败: {e}")
-        import traceback
         traceback.print_exc()
         return
     
     try:
-        # 批量打开逻辑
         count = max(1, args.count)
-        for i in range(count):
-            if count > 1:
-                print(f"\n[正在打开第 {i+1}/{count} 个文件]")
-            
+        if count == 1:
+            # 最常见的单次打开：直接运行，历史记录在 run 中保存
             opener.run()
-            
-            # 如果不是最后一个，且不是第一个，稍微等待一下避免系统卡顿
-            if i < count - 1:
-                time.sleep(0.5)
+        else:
+            # 批量打开逻辑
+            # 一次扫描选出所有文件；可用文件不足时剩余次数按单次流程（含自动重置）处理
+            selected_files = opener.pick_files(count)
+            try:
+                for i in range(count):
+                    print(f"\n[正在打开第 {i+1}/{count} 个文件]")
+                    
+                    # 历史记录只在最后写入一次
+                    started = time.monotonic()
+                    if i < len(selected_files):
+                        opener.run_one(selected_files[i], defer_save=True)
+                    else:
+                        opener.run(defer_save=True)
+                    
+                    # 如果不是最后一个，且本次打开很快完成，稍微等待一下避免系统卡顿
+                    if i < count - 1:
+                        remaining = BATCH_MIN_INTERVAL - (time.monotonic() - started)
+                        if remaining > 0:
+                            time.sleep(remaining)
+            finally:
+                opener.flush_history()
                 
     except KeyboardInterrupt:
         print("\n程序被用户中断")
     except Exception as e:
         print(f"致命错误: {e}")
-        import traceback
         traceback.print_exc()
         return
     
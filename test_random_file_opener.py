@@ -1,4 +1,5 @@
 import unittest
+import hashlib
 import os
 import shutil
 import tempfile
@@ -11,7 +12,7 @@ from importlib.util import spec_from_loader, module_from_spec
 from importlib.machinery import SourceFileLoader
 
 # Standard import now that the filename is English
-from random_file_opener import AtomicCounter, Config, RandomFileOpener
+from random_file_opener import AtomicCounter, Config, FileDescriptorTracker, RandomFileOpener, SimpleLRUCache, main
 
 class TestAtomicCounter(unittest.TestCase):
     def test_increment_decrement(self):
@@ -26,6 +27,47 @@ class TestAtomicCounter(unittest.TestCase):
         self.assertEqual(counter.reset(), 10)
         self.assertEqual(counter.get(), 0)
 
+class TestFileDescriptorTracker(unittest.TestCase):
+    def test_stats(self):
+        tracker = FileDescriptorTracker()
+        tracker.track_open()
+        tracker.track_open()
+        tracker.track_close()
+        stats = tracker.get_stats()
+        self.assertEqual(stats["current"], 1)
+        self.assertEqual(stats["max"], 2)
+        self.assertEqual(stats["leaked"], 1)
+
+    def test_disabled(self):
+        tracker = FileDescriptorTracker(enabled=False)
+        tracker.track_open()
+        self.assertEqual(tracker.get_stats()["opened"], 0)
+
+class TestSimpleLRUCache(unittest.TestCase):
+    def test_eviction_order(self):
+        cache = SimpleLRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # a 变为最近使用
+        cache.put("c", 3)  # 淘汰 b
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_stats(self):
+        cache = SimpleLRUCache(max_size=4)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("missing")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+        cache.clear()
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(len(cache), 0)
+
 class TestConfig(unittest.TestCase):
     def test_defaults(self):
         config = Config()
@@ -39,6 +81,19 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.log_level, "DEBUG")
         self.assertEqual(config.max_retries, 5)
 
+    def test_extension_sets(self):
+        config = Config(system_executable_extensions=['.EXE', '.dll'])
+        self.assertIn('.exe', config._exec_ext_set)
+        self.assertIn('.txt', config._text_ext_set)
+        # 扩展名集合不应写入配置文件
+        self.assertNotIn('_exec_ext_set', config.to_dict())
+        
+        # 运行时修改列表后集合随之更新
+        config.system_executable_extensions.append('.BAT')
+        self.assertIn('.bat', config._exec_ext_set)
+        config.system_executable_extensions[0] = '.msi'
+        self.assertNotIn('.exe', config._exec_ext_set)
+
 class TestRandomFileOpener(unittest.TestCase):
     def setUp(self):
         self.test_dir = tempfile.mkdtemp()
@@ -52,6 +107,8 @@ class TestRandomFileOpener(unittest.TestCase):
     def tearDown(self):
         # 关闭所有handler以释放文件锁
         if hasattr(self.opener, 'logger'):
+            # 先停止后台日志线程，确保队列中的记录写完
+            self.opener._stop_log_listener()
             handlers = self.opener.logger.handlers[:]
             for handler in handlers:
                 handler.close()
@@ -91,10 +148,64 @@ class TestRandomFileOpener(unittest.TestCase):
         self.assertTrue(exclude)
         self.assertEqual(reason, "匹配排除模式")
         
+        # 系统可执行文件 (扩展名不区分大小写)
+        exclude, reason = self.opener.should_exclude("setup.EXE", os.path.join(self.test_dir, "setup.EXE"))
+        self.assertTrue(exclude)
+        self.assertEqual(reason, "系统可执行文件")
+        
         # 3. 隐藏文件
         exclude, reason = self.opener.should_exclude(".hidden", os.path.join(self.test_dir, ".hidden"))
         self.assertTrue(exclude)
         self.assertEqual(reason, "隐藏文件")
+        
+        # 4. 不存在的文件与目录
+        exclude, reason = self.opener.should_exclude("missing.txt", os.path.join(self.test_dir, "missing.txt"))
+        self.assertEqual((exclude, reason), (True, "文件不存在"))
+        os.mkdir(os.path.join(self.test_dir, "subdir"))
+        exclude, reason = self.opener.should_exclude("subdir", os.path.join(self.test_dir, "subdir"))
+        self.assertEqual((exclude, reason), (True, "不是文件"))
+
+    def test_exclude_patterns_recompiled(self):
+        """测试修改 exclude_patterns 后排除规则随之更新"""
+        path = os.path.join(self.test_dir, "notes.md")
+        with open(path, "w") as h:
+            h.write("content")
+        self.assertFalse(self.opener.should_exclude("notes.md", path)[0])
+        self.opener.config.exclude_patterns = self.opener.config.exclude_patterns + ["*.MD"]
+        exclude, reason = self.opener.should_exclude("notes.md", path)
+        self.assertTrue(exclude)
+        self.assertEqual(reason, "匹配排除模式")
+        
+        # 原地追加同样生效
+        self.opener.config.exclude_patterns.append("*.rst")
+        self.assertTrue(self.opener.should_exclude("readme.rst", path)[0])
+        
+        # 原地替换条目（列表长度不变）同样生效
+        txt_path = os.path.join(self.test_dir, "a.txt")
+        with open(txt_path, "w") as h:
+            h.write("content")
+        self.assertFalse(self.opener.should_exclude("a.txt", txt_path)[0])
+        self.opener.config.exclude_patterns[0] = "*.txt"
+        self.assertEqual(self.opener.should_exclude("a.txt", txt_path), (True, "匹配排除模式"))
+
+    def test_get_file_hash(self):
+        """测试文件哈希与缓存"""
+        path = os.path.join(self.test_dir, "hash.txt")
+        with open(path, "wb") as f:
+            f.write(b"hello world" * 1000)
+        
+        # 默认指纹模式只使用 stat 信息
+        st = os.stat(path)
+        self.assertEqual(self.opener.get_file_hash(path), f"{st.st_size}:{st.st_mtime_ns}:{st.st_ino}")
+        
+        # 未安装blake3时回退到SHA-256
+        self.opener.config.hash_mode = "full"
+        expected = hashlib.sha256(b"hello world" * 1000).hexdigest()
+        with patch("random_file_opener.blake3", None):
+            self.assertEqual(self.opener.get_file_hash(path), expected)
+        # 第二次从缓存返回
+        self.assertEqual(self.opener.get_file_hash(path), expected)
+        self.assertEqual(self.opener.get_file_hash(os.path.join(self.test_dir, "missing.txt")), "")
 
     def test_scan_qualified_files(self):
         # 创建一组文件
@@ -110,6 +221,131 @@ class TestRandomFileOpener(unittest.TestCase):
         self.assertIn("c.py", qualified)
         self.assertNotIn("ignore.tmp", qualified) # 默认配置包含 *.tmp 排除
 
+    def test_scan_cache_dir_mtime(self):
+        """测试缓存过期后目录未变化时不重新扫描，新增文件后重新扫描"""
+        with open(os.path.join(self.test_dir, "a.txt"), "w") as h:
+            h.write("content")
+        self.opener.config.cache_ttl = 0
+        qualified, _, _ = self.opener.scan_qualified_files()
+        self.assertEqual(qualified, ["a.txt"])
+        
+        with patch("random_file_opener.os.scandir") as mock_scandir:
+            self.assertEqual(self.opener.scan_qualified_files()[0], ["a.txt"])
+            mock_scandir.assert_not_called()
+        
+        with open(os.path.join(self.test_dir, "b.txt"), "w") as h:
+            h.write("content")
+        st = os.stat(self.test_dir)
+        # 保证目录修改时间变化（部分文件系统时间精度较低）
+        os.utime(self.test_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+        self.assertEqual(sorted(self.opener.scan_qualified_files()[0]), ["a.txt", "b.txt"])
+
+    def test_scan_cache_follows_exclude_rules(self):
+        """测试目录未变化但排除规则修改后重新扫描"""
+        for name in ["a.txt", "b.md"]:
+            with open(os.path.join(self.test_dir, name), "w") as h:
+                h.write("content")
+        self.assertIn("b.md", self.opener.scan_qualified_files()[0])
+        
+        self.opener.config.exclude_patterns = self.opener.config.exclude_patterns + ["*.md"]
+        self.assertEqual(self.opener.scan_qualified_files()[0], ["a.txt"])
+        
+        # 原地替换最后一条规则
+        self.opener.config.exclude_patterns[-1] = "*.txt"
+        self.assertEqual(self.opener.scan_qualified_files()[0], ["b.md"])
+        
+        # 运行时修改系统可执行文件扩展名
+        self.opener.config.system_executable_extensions.append(".MD")
+        self.assertEqual(self.opener.scan_qualified_files()[0], [])
+
+    def test_scan_qualified_files_many(self):
+        """测试较多文件时的扫描结果"""
+        names = [f"file_{i}.txt" for i in range(25)] + ["skip.tmp", "tool.exe"]
+        for name in names:
+            with open(os.path.join(self.test_dir, name), "w") as h:
+                h.write("content")
+        
+        qualified, success, _ = self.opener.scan_qualified_files(force_refresh=True)
+        self.assertTrue(success)
+        self.assertEqual(sorted(qualified), sorted(names[:25]))
+
+    def test_scan_excludes_symlinks(self):
+        """测试扫描时通过 DirEntry 排除符号链接"""
+        target = os.path.join(self.test_dir, "real.txt")
+        with open(target, "w") as h:
+            h.write("content")
+        try:
+            os.symlink(target, os.path.join(self.test_dir, "link.txt"))
+        except (OSError, NotImplementedError):
+            self.skipTest("当前环境不支持创建符号链接")
+        
+        qualified, success, _ = self.opener.scan_qualified_files(force_refresh=True)
+        self.assertTrue(success)
+        self.assertIn("real.txt", qualified)
+        self.assertNotIn("link.txt", qualified)
+
+    def test_save_and_load_history(self):
+        """测试历史记录的保存、读取与未变化时跳过写入"""
+        history = self.opener.load_history()
+        history["opened_files"].update({"b.txt", "a.txt"})
+        self.opener.save_history(history)
+        
+        # 集合在写盘时转为排序后的列表
+        with open(self.opener.history_file, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["opened_files"], ["a.txt", "b.txt"])
+        
+        # 新实例从磁盘读取时还原为集合
+        loaded = RandomFileOpener(self.config, self.test_dir).load_history()
+        self.assertEqual(loaded["opened_files"], {"a.txt", "b.txt"})
+        self.assertEqual(loaded["failed_files"], set())
+        
+        history_file = self.opener.history_file
+        mtime = history_file.stat().st_mtime_ns
+        with patch("random_file_opener.os.replace") as mock_replace:
+            self.opener.save_history(history)
+            mock_replace.assert_not_called()
+        self.assertEqual(history_file.stat().st_mtime_ns, mtime)
+
+    def test_log_queue_listener(self):
+        """测试日志经队列由后台线程写入文件"""
+        self.opener.log_message("queued message")
+        self.opener._stop_log_listener()
+        with open(self.opener.log_file, encoding='utf-8') as f:
+            self.assertIn("queued message", f.read())
+
+    def test_console_handler_not_queued(self):
+        """测试控制台handler直接挂在logger上，重新创建实例时旧handler能被正确替换"""
+        self.opener._stop_log_listener()
+        self.config.log_to_console = True
+        self.opener = RandomFileOpener(self.config, self.test_dir)
+        self.opener = RandomFileOpener(self.config, self.test_dir)
+        handlers = self.opener.logger.handlers
+        self.assertEqual(
+            sorted(type(h).__name__ for h in handlers), ["QueueHandler", "StreamHandler"]
+        )
+
+    def test_load_history_disjoint_sets(self):
+        """测试旧记录中同时出现在两个列表的文件按已打开处理"""
+        with open(self.opener.history_file, "w", encoding="utf-8") as f:
+            json.dump({"opened_files": ["a.txt"], "failed_files": ["a.txt", "b.txt"]}, f)
+        history = self.opener.load_history()
+        self.assertEqual(history["opened_files"], {"a.txt"})
+        self.assertEqual(history["failed_files"], {"b.txt"})
+
+    def test_save_history_non_atomic(self):
+        """测试关闭原子写入时直接覆盖历史文件"""
+        self.opener.config.atomic_history_write = False
+        history = self.opener.load_history()
+        history["failed_files"].add("b.txt")
+        with patch("random_file_opener.os.replace") as mock_replace:
+            self.opener.save_history(history)
+            mock_replace.assert_not_called()
+        with open(self.opener.history_file, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["failed_files"], ["b.txt"])
+        self.assertEqual(
+            [p for p in os.listdir(self.test_dir) if ".tmp." in p], []
+        )
+
     def test_frozen_path(self):
         """测试打包环境下的路径检测"""
         params = {'frozen': True, 'executable': str(Path(self.test_dir) / "test_exe.exe")}
@@ -173,6 +409,69 @@ class TestRandomFileOpener(unittest.TestCase):
         except Exception as e:
             self.fail(f"Batch execution simulation failed: {e}")
 
+    def test_run_reuses_scan_for_statistics(self):
+        """测试 run 把扫描得到的文件总数传给 show_statistics"""
+        for name in ["a.txt", "b.txt"]:
+            with open(os.path.join(self.test_dir, name), "w") as h:
+                h.write("content")
+        
+        with patch.object(self.opener, 'open_file_with_retry', return_value=True), \
+             patch.object(self.opener, 'show_statistics') as mock_stats:
+            self.opener.run()
+        
+        mock_stats.assert_called_once()
+        self.assertEqual(mock_stats.call_args[0][1], 2)
+
+    def test_run_defer_save(self):
+        """测试延迟保存时多次运行只在 flush_history 时写入一次"""
+        for name in ["a.txt", "b.txt"]:
+            with open(os.path.join(self.test_dir, name), "w") as h:
+                h.write("content")
+        
+        with patch.object(self.opener, 'open_file_with_retry', return_value=True), \
+             patch.object(self.opener, 'show_statistics'), \
+             patch.object(self.opener, 'save_history', wraps=self.opener.save_history) as mock_save:
+            self.opener.run(defer_save=True)
+            self.opener.run(defer_save=True)
+            mock_save.assert_not_called()
+            self.opener.flush_history()
+            mock_save.assert_called_once()
+        
+        loaded = RandomFileOpener(self.config, self.test_dir).load_history()
+        self.assertEqual(loaded["opened_files"], {"a.txt", "b.txt"})
+
+    def test_batch_stops_on_keyboard_interrupt(self):
+        """测试批量打开时 Ctrl+C 结束整个循环，且已选出的结果不会继续打开"""
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            with open(os.path.join(self.test_dir, name), "w") as h:
+                h.write("content")
+        
+        argv = ['script.py', '--dir', self.test_dir, '--count', '3', '--wait-time', '0', '--no-console-log']
+        with patch('sys.argv', argv), \
+             patch.object(RandomFileOpener, 'open_file_with_retry', autospec=True,
+                          side_effect=KeyboardInterrupt) as mock_open:
+            main()
+        mock_open.call_args[0][0]._stop_log_listener()
+        self.assertEqual(mock_open.call_count, 1)
+
+    def test_pick_files(self):
+        """测试批量选择文件不重复且不超过可用数量"""
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            with open(os.path.join(self.test_dir, name), "w") as h:
+                h.write("content")
+        
+        picked = self.opener.pick_files(2)
+        self.assertEqual(len(picked), 2)
+        self.assertEqual(len(set(picked)), 2)
+        self.assertEqual(sorted(self.opener.pick_files(10)), ["a.txt", "b.txt", "c.txt"])
+        
+        with patch.object(self.opener, 'open_file_with_retry', return_value=False), \
+             patch.object(self.opener, 'show_statistics'), \
+             patch.object(self.opener, 'scan_qualified_files') as mock_scan:
+            self.opener.run_one("a.txt")
+            mock_scan.assert_not_called()
+        self.assertIn("a.txt", self.opener.load_history()["failed_files"])
+
     def test_run_integrity(self):
         """测试 run 方法的完整性 (确保所有引用都存在)"""
         # 模拟依赖，只为了让 run 能跑到 random.choice 那一行